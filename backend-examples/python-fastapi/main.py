@@ -8,6 +8,7 @@ Endpoints:
 - POST /payment/create      - Create a payment
 - POST /payment/3ds/init    - Initialize 3DS payment
 - POST /payment/3ds/complete - Complete 3DS payment
+- POST /payment/3ds/complete_and_refresh - Complete 3DS payment and fetch its status
 - GET  /payment/installments - Query installment options
 - POST /payment/refund      - Process refund
 - GET  /payment/status/{id} - Get payment status
@@ -16,14 +17,33 @@ Endpoints:
 - DELETE /payment/cards/{token} - Delete saved card
 """
 
+import asyncio
+import base64
+import hashlib
+import hmac
 import os
+import re
+import secrets
+import sys
 import time
-from typing import Any, Optional
+from decimal import Decimal, InvalidOperation
+from typing import Annotated, Any, Optional, Union
+from uuid import uuid4
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import iyzipay
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, BeforeValidator, ConfigDict, WithJsonSchema
+import httpx
+import msgspec
+import orjson
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from slowapi import Limiter
+from slowapi.errors import RateLimitExceeded
+from slowapi.util import get_remote_address
 
 load_dotenv()
 
@@ -31,27 +51,215 @@ app = FastAPI(
     title="TR Payment Hub Backend",
     description="Backend proxy for tr_payment_hub Flutter package",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
 
-# CORS middleware
+# CORS middleware (explicit origins; credentialed requests cannot use "*")
+ALLOWED_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("ALLOWED_ORIGINS", "https://app.example.com").split(",")
+    if origin.strip()
+]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "DELETE"],
+    allow_headers=["authorization", "content-type"],
+    max_age=86400,  # let browsers cache preflight responses for 24 hours
 )
 
+# Compress larger responses (3DS HTML content, installment tables, card lists)
+app.add_middleware(GZipMiddleware, minimum_size=1000, compresslevel=6)
+
+
+# Access log: records are queued per request and written in batches by one task
+_access_log_queue: asyncio.Queue = asyncio.Queue(maxsize=10000)
+ACCESS_LOG_BATCH_SIZE = 100
+
+
+class AccessLogMiddleware:
+    """Pure ASGI middleware that queues one JSON access log record per request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            record = {
+                "ts": time.time(),
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "durationMs": round((time.perf_counter() - start) * 1000, 2),
+            }
+            try:
+                _access_log_queue.put_nowait(record)
+            except asyncio.QueueFull:
+                pass  # drop rather than slow down requests
+
+
+def _write_access_log(batch: list[dict]) -> None:
+    sys.stdout.buffer.write(b"".join(orjson.dumps(record) + b"\n" for record in batch))
+    sys.stdout.flush()
+
+
+async def _drain_access_log():
+    while True:
+        batch = [await _access_log_queue.get()]
+        while len(batch) < ACCESS_LOG_BATCH_SIZE and not _access_log_queue.empty():
+            batch.append(_access_log_queue.get_nowait())
+        _write_access_log(batch)
+
+
+app.add_middleware(AccessLogMiddleware)
+
+# Per-IP rate limiting (set RATE_LIMIT_STORAGE_URI=redis://... to share across workers)
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+limiter = Limiter(key_func=get_remote_address, storage_uri=RATE_LIMIT_STORAGE_URI)
+app.state.limiter = limiter
+
+PAYMENT_RATE_LIMIT = os.getenv("PAYMENT_RATE_LIMIT", "10/minute")
+READ_RATE_LIMIT = os.getenv("READ_RATE_LIMIT", "60/minute")
+
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    """Return rate limit errors in the same shape as payment errors."""
+    return ORJSONResponse(
+        status_code=429,
+        content={
+            "success": False,
+            "errorCode": "rate_limit_exceeded",
+            "errorMessage": f"Rate limit exceeded: {exc.detail}",
+        },
+    )
+
+
 # iyzico configuration
 options = {
     "api_key": os.getenv("IYZICO_API_KEY"),
     "secret_key": os.getenv("IYZICO_SECRET_KEY"),
     "base_url": os.getenv("IYZICO_BASE_URL", "https://sandbox-api.iyzipay.com"),
 }
+if not options["api_key"] or not options["secret_key"]:
+    raise RuntimeError("IYZICO_API_KEY and IYZICO_SECRET_KEY must be set (see .env.example)")
+
+# Shared HTTP client for iyzico (keep-alive connection pool, HTTP/2)
+client = httpx.AsyncClient(
+    base_url=options["base_url"],
+    http2=True,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    timeout=30.0,
+)
+
+# Keyed HMAC and auth prefix are built once and copied per request
+_iyzico_hmac = hmac.new(options["secret_key"].encode(), digestmod=hashlib.sha256)
+_iyzico_auth_prefix = f"apiKey:{options['api_key']}&randomKey:"
+
+# Upper bound on in-flight iyzico calls per process
+_iyzico_sem = asyncio.Semaphore(int(os.getenv("IYZICO_MAX_CONCURRENCY", 64)))
+
+
+# Optional Redis cache for installment lookups (disabled when REDIS_URL is unset)
+redis = Redis.from_url(os.environ["REDIS_URL"]) if os.getenv("REDIS_URL") else None
+INSTALLMENT_CACHE_TTL = int(os.getenv("INSTALLMENT_CACHE_TTL", 3600))
+
+
+WARMUP_TIMEOUT = 2.0
+
+
+async def _warm_connections():
+    warmups = [client.head("/", timeout=WARMUP_TIMEOUT) for _ in range(5)]
+    if redis is not None:
+        warmups += [asyncio.wait_for(redis.ping(), WARMUP_TIMEOUT) for _ in range(5)]
+    await asyncio.gather(*warmups, return_exceptions=True)
+
+
+@app.on_event("startup")
+async def warm_connections():
+    """Open pooled connections up front so the first payment skips the TLS handshake."""
+    # Warm-up is best effort and runs in the background so it never delays startup
+    app.state.warmup_task = asyncio.create_task(_warm_connections())
+
+
+@app.on_event("startup")
+async def start_access_log():
+    """Start the access log writer task."""
+    app.state.access_log_task = asyncio.create_task(_drain_access_log())
+
+
+@app.on_event("shutdown")
+async def stop_access_log():
+    """Stop the access log writer and flush queued records."""
+    app.state.access_log_task.cancel()
+    batch = []
+    while not _access_log_queue.empty():
+        batch.append(_access_log_queue.get_nowait())
+    if batch:
+        _write_access_log(batch)
+
+
+@app.on_event("shutdown")
+async def close_client():
+    """Close the iyzico HTTP client."""
+    await client.aclose()
+
+
+@app.on_event("shutdown")
+async def close_redis():
+    """Close the Redis connection pool."""
+    if redis is not None:
+        await redis.aclose()
+
+
+def _to_cents(value: Any) -> Any:
+    """Convert a decimal amount (e.g. 99.9) to integer cents (9990)."""
+    if isinstance(value, bool):
+        raise ValueError("amount must be a number")
+    if not isinstance(value, (int, float, str, Decimal)):
+        return value
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError("amount must be a number") from None
+    if not amount.is_finite():
+        raise ValueError("amount must be a finite number")
+    if amount.adjusted() >= 15:  # also keeps int() away from huge exponents like 1e999999
+        raise ValueError("amount is too large")
+    cents = amount * 100
+    if cents != cents.to_integral_value():
+        raise ValueError("amount must have at most 2 decimal places")
+    return int(cents)
+
+
+# Monetary amounts arrive as decimal numbers and are held as integer cents
+Cents = Annotated[int, BeforeValidator(_to_cents), WithJsonSchema({"type": "number"})]
 
 
 # Pydantic models
-class CardInfo(BaseModel):
+class ApiModel(BaseModel):
+    """Base model for request payloads (pydantic v2, unknown fields ignored)."""
+
+    model_config = ConfigDict(extra="ignore")
+
+
+class CardInfo(ApiModel):
     cardHolderName: str
     cardNumber: str
     expireMonth: str
@@ -60,7 +268,7 @@ class CardInfo(BaseModel):
     registerCard: bool = False
 
 
-class BuyerInfo(BaseModel):
+class BuyerInfo(ApiModel):
     id: str
     name: str
     surname: str
@@ -73,18 +281,18 @@ class BuyerInfo(BaseModel):
     identityNumber: Optional[str] = "11111111111"
 
 
-class BasketItem(BaseModel):
+class BasketItem(ApiModel):
     id: str
     name: str
     category: str
-    price: float
+    price: Cents
     itemType: str = "physical"
 
 
-class PaymentRequest(BaseModel):
+class PaymentRequest(ApiModel):
     orderId: str
-    amount: float
-    paidPrice: Optional[float] = None
+    amount: Cents
+    paidPrice: Optional[Cents] = None
     currency: str = "tryLira"
     installment: int = 1
     card: CardInfo
@@ -93,46 +301,195 @@ class PaymentRequest(BaseModel):
     callbackUrl: Optional[str] = None
 
 
-class RefundRequest(BaseModel):
+class RefundRequest(ApiModel):
     transactionId: str
-    amount: float
+    amount: Cents
 
 
-class ChargeRequest(BaseModel):
+class ChargeRequest(ApiModel):
     cardToken: str
     cardUserKey: str
     orderId: str
-    amount: float
+    amount: Cents
     buyer: BuyerInfo
     basketItems: list[BasketItem]
 
 
-class ThreeDSCompleteRequest(BaseModel):
+class ThreeDSCompleteRequest(ApiModel):
     transactionId: str
     callbackData: Optional[dict] = None
 
 
+# msgspec structs mirroring PaymentRequest for the /payment/create fast path
+class _Card(msgspec.Struct, kw_only=True):
+    cardHolderName: str
+    cardNumber: str
+    expireMonth: str
+    expireYear: str
+    cvc: str
+    registerCard: bool = False
+
+
+class _Buyer(msgspec.Struct, kw_only=True):
+    id: str
+    name: str
+    surname: str
+    email: str
+    phone: str
+    ip: str
+    city: str
+    country: str
+    address: str
+    identityNumber: Optional[str] = "11111111111"
+
+
+class _Basket(msgspec.Struct, kw_only=True):
+    id: str
+    name: str
+    category: str
+    price: float  # converted to cents by _decode_payment_request
+    itemType: str = "physical"
+
+
+class _PaymentReq(msgspec.Struct, kw_only=True):
+    orderId: str
+    amount: float  # converted to cents by _decode_payment_request
+    paidPrice: Optional[float] = None  # converted to cents by _decode_payment_request
+    currency: str = "tryLira"
+    installment: int = 1
+    card: _Card
+    buyer: _Buyer
+    basketItems: list[_Basket]
+    callbackUrl: Optional[str] = None
+
+
+_payment_req_decoder = msgspec.json.Decoder(_PaymentReq, strict=False)
+
+
+def _struct_cents(value: float, path: str) -> int:
+    """Convert a decoded struct amount to cents, reporting failures like msgspec does."""
+    try:
+        return _to_cents(value)
+    except ValueError as e:
+        raise msgspec.ValidationError(f"{e} - at `{path}`") from None
+
+
+def _is_json_content_type(content_type: str) -> bool:
+    """Return True for application/json and application/*+json media types."""
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return media_type == "application/json" or (
+        media_type.startswith("application/") and media_type.endswith("+json")
+    )
+
+
+def _validation_error(e: msgspec.DecodeError) -> RequestValidationError:
+    """Translate a msgspec error into FastAPI's standard 422 error shape."""
+    message, _, path = str(e).partition(" - at `")
+    loc: list[Any] = ["body"]
+    for name, index in re.findall(r"\.([^.\[`]+)|\[(\d+)\]", path):
+        loc.append(name or int(index))
+    error_type = "value_error" if isinstance(e, msgspec.ValidationError) else "json_invalid"
+    return RequestValidationError([{"type": error_type, "loc": loc, "msg": message, "input": None}])
+
+
+def _decode_payment_request(raw: bytes) -> _PaymentReq:
+    """Decode a payment request body and convert its amounts to cents."""
+    req = _payment_req_decoder.decode(raw)
+    req.amount = _struct_cents(req.amount, "$.amount")
+    if req.paidPrice is not None:
+        req.paidPrice = _struct_cents(req.paidPrice, "$.paidPrice")
+    for i, item in enumerate(req.basketItems):
+        item.price = _struct_cents(item.price, f"$.basketItems[{i}].price")
+    return req
+
+
+# Flutter currency -> iyzico currency code
+_CURRENCY_MAP = {
+    "tryLira": "TRY",
+    "usd": "USD",
+    "eur": "EUR",
+    "gbp": "GBP",
+}
+
+# Flutter basket item type -> iyzico item type
+_ITEM_TYPE_MAP = {"physical": "PHYSICAL"}
+_DEFAULT_ITEM_TYPE = "VIRTUAL"
+
+
 # Helper functions
-def map_currency(currency: str) -> str:
-    """Convert Flutter currency to iyzico currency code."""
-    mapping = {
-        "tryLira": "TRY",
-        "usd": "USD",
-        "eur": "EUR",
-        "gbp": "GBP",
+def iyzico_auth_header(path: str, random_key: str, body: bytes) -> str:
+    """Build the iyzico IYZWSv2 authorization header."""
+    mac = _iyzico_hmac.copy()
+    mac.update((random_key + path).encode() + body)
+    auth = f"{_iyzico_auth_prefix}{random_key}&signature:{mac.hexdigest()}"
+    return "IYZWSv2 " + base64.b64encode(auth.encode()).decode()
+
+
+async def iyzico_call(method: str, path: str, body: dict) -> dict:
+    """Send a signed request to the iyzico API and return the decoded response."""
+    content = orjson.dumps(body)
+    random_key = secrets.token_hex(8)
+    async with _iyzico_sem:
+        response = await client.request(
+            method,
+            path,
+            content=content,
+            headers={
+                "Accept": "application/json",
+                "Content-Type": "application/json",
+                "Authorization": iyzico_auth_header(path, random_key, content),
+                "x-iyzi-rnd": random_key,
+            },
+        )
+    return orjson.loads(response.content)
+
+
+async def iyzico_post(path: str, body: dict) -> dict:
+    """Send a signed POST request to the iyzico API."""
+    return await iyzico_call("POST", path, body)
+
+
+def _fmt_money(cents: int) -> str:
+    """Format integer cents as an iyzico price string (e.g. 9990 -> "99.90")."""
+    sign = "-" if cents < 0 else ""
+    cents = abs(cents)
+    return f"{sign}{cents // 100}.{cents % 100:02d}"
+
+
+def _buyer_blocks(b: BuyerInfo) -> tuple[dict, dict, dict]:
+    """Build iyzico buyer, shipping address and billing address blocks."""
+    contact_name = f"{b.name} {b.surname}"
+    buyer = {
+        "id": b.id,
+        "name": b.name,
+        "surname": b.surname,
+        "gsmNumber": b.phone,
+        "email": b.email,
+        "identityNumber": b.identityNumber or "11111111111",
+        "registrationAddress": b.address,
+        "ip": b.ip,
+        "city": b.city,
+        "country": b.country,
     }
-    return mapping.get(currency, "TRY")
+    address = {
+        "contactName": contact_name,
+        "city": b.city,
+        "country": b.country,
+        "address": b.address,
+    }
+    return buyer, address, dict(address)
 
 
-def map_payment_request(req: PaymentRequest) -> dict:
+def map_payment_request(req: Union[PaymentRequest, _PaymentReq]) -> dict:
     """Convert Flutter request to iyzico format."""
     paid_price = req.paidPrice or req.amount
+    buyer, shipping_address, billing_address = _buyer_blocks(req.buyer)
     return {
         "locale": "tr",
         "conversationId": req.orderId,
-        "price": str(req.amount),
-        "paidPrice": str(paid_price),
-        "currency": map_currency(req.currency),
+        "price": _fmt_money(req.amount),
+        "paidPrice": _fmt_money(paid_price),
+        "currency": _CURRENCY_MAP.get(req.currency, "TRY"),
         "installment": str(req.installment),
         "basketId": req.orderId,
         "paymentChannel": "WEB",
@@ -145,43 +502,47 @@ def map_payment_request(req: PaymentRequest) -> dict:
             "cvc": req.card.cvc,
             "registerCard": "1" if req.card.registerCard else "0",
         },
-        "buyer": {
-            "id": req.buyer.id,
-            "name": req.buyer.name,
-            "surname": req.buyer.surname,
-            "gsmNumber": req.buyer.phone,
-            "email": req.buyer.email,
-            "identityNumber": req.buyer.identityNumber or "11111111111",
-            "registrationAddress": req.buyer.address,
-            "ip": req.buyer.ip,
-            "city": req.buyer.city,
-            "country": req.buyer.country,
-        },
-        "shippingAddress": {
-            "contactName": f"{req.buyer.name} {req.buyer.surname}",
-            "city": req.buyer.city,
-            "country": req.buyer.country,
-            "address": req.buyer.address,
-        },
-        "billingAddress": {
-            "contactName": f"{req.buyer.name} {req.buyer.surname}",
-            "city": req.buyer.city,
-            "country": req.buyer.country,
-            "address": req.buyer.address,
-        },
+        "buyer": buyer,
+        "shippingAddress": shipping_address,
+        "billingAddress": billing_address,
         "basketItems": [
             {
                 "id": item.id,
                 "name": item.name,
                 "category1": item.category,
-                "itemType": "PHYSICAL" if item.itemType == "physical" else "VIRTUAL",
-                "price": str(item.price),
+                "itemType": _ITEM_TYPE_MAP.get(item.itemType, _DEFAULT_ITEM_TYPE),
+                "price": _fmt_money(item.price),
             }
             for item in req.basketItems
         ],
     }
 
 
+def _server_error(e: Exception) -> HTTPException:
+    """Build the 500 error returned when an unexpected exception occurs."""
+    return HTTPException(
+        status_code=500,
+        detail={"success": False, "errorCode": "server_error", "errorMessage": str(e)},
+    )
+
+
+def _client_error(status_code: int, error_code: str, error_message: str) -> HTTPException:
+    """Build a 4xx error in the success/errorCode/errorMessage shape."""
+    return HTTPException(
+        status_code=status_code,
+        detail={"success": False, "errorCode": error_code, "errorMessage": error_message},
+    )
+
+
+def _bad_request(result: dict, default_code: str, default_message: str) -> HTTPException:
+    """Build the 400 error returned when iyzico reports a failure."""
+    return _client_error(
+        400,
+        result.get("errorCode", default_code),
+        result.get("errorMessage", default_message),
+    )
+
+
 def map_payment_response(result: dict) -> dict:
     """Map iyzico response to Flutter format."""
     if result.get("status") == "success":
@@ -205,17 +566,35 @@ def map_payment_response(result: dict) -> dict:
 
 
 # Endpoints
-@app.post("/payment/create")
-async def create_payment(request: PaymentRequest):
+# The body is decoded with msgspec instead of pydantic; the PaymentRequest
+# schema (registered via /payment/3ds/init) is kept for the OpenAPI docs.
+@app.post(
+    "/payment/create",
+    openapi_extra={
+        "requestBody": {
+            "content": {
+                "application/json": {"schema": {"$ref": "#/components/schemas/PaymentRequest"}}
+            },
+            "required": True,
+        }
+    },
+)
+@limiter.limit(PAYMENT_RATE_LIMIT)
+async def create_payment(request: Request):
     """Create a payment."""
+    if not _is_json_content_type(request.headers.get("content-type", "")):
+        raise _client_error(
+            415, "unsupported_media_type", "Content-Type must be application/json"
+        )
+
     try:
-        iyzico_request = map_payment_request(request)
-        payment = iyzipay.Payment().create(iyzico_request, options)
-        result = payment.read()
+        body = _decode_payment_request(await request.body())
+    except msgspec.DecodeError as e:
+        raise _validation_error(e) from None
 
-        if isinstance(result, str):
-            import json
-            result = json.loads(result)
+    try:
+        iyzico_request = map_payment_request(body)
+        result = await iyzico_post("/payment/auth", iyzico_request)
 
         response = map_payment_response(result)
         if not response["success"]:
@@ -225,25 +604,18 @@ async def create_payment(request: PaymentRequest):
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail={"success": False, "errorCode": "server_error", "errorMessage": str(e)},
-        )
+        raise _server_error(e)
 
 
 @app.post("/payment/3ds/init")
-async def init_3ds_payment(request: PaymentRequest):
+@limiter.limit(PAYMENT_RATE_LIMIT)
+async def init_3ds_payment(request: Request, body: PaymentRequest):
     """Initialize 3DS payment."""
     try:
-        iyzico_request = map_payment_request(request)
-        iyzico_request["callbackUrl"] = request.callbackUrl
-
-        threeds_init = iyzipay.ThreedsInitialize().create(iyzico_request, options)
-        result = threeds_init.read()
+        iyzico_request = map_payment_request(body)
+        iyzico_request["callbackUrl"] = body.callbackUrl
 
-        if isinstance(result, str):
-            import json
-            result = json.loads(result)
+        result = await iyzico_post("/payment/3dsecure/initialize", iyzico_request)
 
         if result.get("status") == "success":
             return {
@@ -253,81 +625,113 @@ async def init_3ds_payment(request: PaymentRequest):
                 "htmlContent": result.get("threeDSHtmlContent"),
             }
 
-        raise HTTPException(
-            status_code=400,
-            detail={
-                "success": False,
-                "errorCode": result.get("errorCode", "3ds_init_failed"),
-                "errorMessage": result.get("errorMessage", "3DS initialization failed"),
-            },
-        )
+        raise _bad_request(result, "3ds_init_failed", "3DS initialization failed")
 
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail={"success": False, "errorCode": "server_error", "errorMessage": str(e)},
-        )
+        raise _server_error(e)
 
 
 @app.post("/payment/3ds/complete")
-async def complete_3ds_payment(request: ThreeDSCompleteRequest):
+@limiter.limit(PAYMENT_RATE_LIMIT)
+async def complete_3ds_payment(request: Request, body: ThreeDSCompleteRequest):
     """Complete 3DS payment."""
     try:
         iyzico_request = {
             "locale": "tr",
-            "conversationId": request.transactionId,
-            "paymentId": (request.callbackData or {}).get("paymentId", request.transactionId),
+            "conversationId": body.transactionId,
+            "paymentId": (body.callbackData or {}).get("paymentId", body.transactionId),
         }
 
-        threeds_payment = iyzipay.ThreedsPayment().create(iyzico_request, options)
-        result = threeds_payment.read()
+        result = await iyzico_post("/payment/3dsecure/auth", iyzico_request)
+
+        response = map_payment_response(result)
+        if not response["success"]:
+            raise HTTPException(status_code=400, detail=response)
+        return response
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise _server_error(e)
+
+
+@app.post("/payment/3ds/complete_and_refresh")
+@limiter.limit(PAYMENT_RATE_LIMIT)
+async def complete_3ds_and_refresh(request: Request, body: ThreeDSCompleteRequest):
+    """Complete 3DS payment and fetch its resulting status in a single client call."""
+    try:
+        payment_id = (body.callbackData or {}).get("paymentId", body.transactionId)
+        complete_request = {
+            "locale": "tr",
+            "conversationId": body.transactionId,
+            "paymentId": payment_id,
+        }
+        status_request = {
+            "locale": "tr",
+            "conversationId": uuid4().hex,
+            "paymentId": payment_id,
+        }
 
-        if isinstance(result, str):
-            import json
-            result = json.loads(result)
+        # The auth call finalises the payment, so the status is read only after it succeeds
+        result = await iyzico_post("/payment/3dsecure/auth", complete_request)
 
         response = map_payment_response(result)
         if not response["success"]:
             raise HTTPException(status_code=400, detail=response)
+
+        # Status lookup is best effort; fall back to the successful auth result
+        response["status"] = "success"
+        try:
+            status_result = await iyzico_post("/payment/detail", status_request)
+        except Exception:
+            status_result = {}
+        if status_result.get("status") == "success":
+            response["status"] = (
+                "success" if status_result.get("paymentStatus") == "1" else "pending"
+            )
         return response
 
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail={"success": False, "errorCode": "server_error", "errorMessage": str(e)},
-        )
+        raise _server_error(e)
 
 
 @app.get("/payment/installments")
+@limiter.limit(READ_RATE_LIMIT)
 async def get_installments(
-    binNumber: str = Query(..., min_length=6, max_length=8),
-    amount: float = Query(..., gt=0),
+    request: Request,
+    binNumber: Annotated[str, Query(min_length=6, max_length=8)],
+    amount: Annotated[Cents, Query(gt=0)],
 ):
     """Query installment options."""
     try:
+        # Amount is validated as cents, so "99.0" and "99.00" share a cache entry
+        cache_key = f"inst:{binNumber}:{amount}"
+        if redis is not None:
+            try:
+                cached = await redis.get(cache_key)
+            except RedisError:
+                cached = None
+            if cached:
+                return orjson.loads(cached)
+
         iyzico_request = {
             "locale": "tr",
-            "conversationId": str(int(time.time())),
+            "conversationId": uuid4().hex,
             "binNumber": binNumber,
-            "price": str(amount),
+            "price": _fmt_money(amount),
         }
 
-        installment_info = iyzipay.InstallmentInfo().retrieve(iyzico_request, options)
-        result = installment_info.read()
-
-        if isinstance(result, str):
-            import json
-            result = json.loads(result)
+        result = await iyzico_post("/payment/iyzipos/installment", iyzico_request)
 
         if result.get("status") == "success":
             details = result.get("installmentDetails", [])
             if details:
                 detail = details[0]
-                return {
+                response = {
                     "success": True,
                     "binNumber": detail.get("binNumber"),
                     "bankName": detail.get("bankName"),
@@ -343,43 +747,35 @@ async def get_installments(
                         for opt in detail.get("installmentPrices", [])
                     ],
                 }
+                if redis is not None:
+                    try:
+                        await redis.setex(cache_key, INSTALLMENT_CACHE_TTL, orjson.dumps(response))
+                    except RedisError:
+                        pass
+                return response
 
-        raise HTTPException(
-            status_code=400,
-            detail={
-                "success": False,
-                "errorCode": result.get("errorCode", "no_installments"),
-                "errorMessage": result.get("errorMessage", "No installment options found"),
-            },
-        )
+        raise _bad_request(result, "no_installments", "No installment options found")
 
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail={"success": False, "errorCode": "server_error", "errorMessage": str(e)},
-        )
+        raise _server_error(e)
 
 
 @app.post("/payment/refund")
-async def refund_payment(request: RefundRequest):
+@limiter.limit(PAYMENT_RATE_LIMIT)
+async def refund_payment(request: Request, body: RefundRequest):
     """Process refund."""
     try:
         iyzico_request = {
             "locale": "tr",
-            "conversationId": str(int(time.time())),
-            "paymentTransactionId": request.transactionId,
-            "price": str(request.amount),
+            "conversationId": uuid4().hex,
+            "paymentTransactionId": body.transactionId,
+            "price": _fmt_money(body.amount),
             "currency": "TRY",
         }
 
-        refund = iyzipay.Refund().create(iyzico_request, options)
-        result = refund.read()
-
-        if isinstance(result, str):
-            import json
-            result = json.loads(result)
+        result = await iyzico_post("/payment/refund", iyzico_request)
 
         if result.get("status") == "success":
             return {
@@ -388,40 +784,26 @@ async def refund_payment(request: RefundRequest):
                 "refundedAmount": float(result.get("price", 0)),
             }
 
-        raise HTTPException(
-            status_code=400,
-            detail={
-                "success": False,
-                "errorCode": result.get("errorCode", "refund_failed"),
-                "errorMessage": result.get("errorMessage", "Refund failed"),
-            },
-        )
+        raise _bad_request(result, "refund_failed", "Refund failed")
 
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail={"success": False, "errorCode": "server_error", "errorMessage": str(e)},
-        )
+        raise _server_error(e)
 
 
 @app.get("/payment/status/{payment_id}")
-async def get_payment_status(payment_id: str):
+@limiter.limit(READ_RATE_LIMIT)
+async def get_payment_status(request: Request, payment_id: str):
     """Get payment status."""
     try:
         iyzico_request = {
             "locale": "tr",
-            "conversationId": str(int(time.time())),
+            "conversationId": uuid4().hex,
             "paymentId": payment_id,
         }
 
-        payment = iyzipay.Payment().retrieve(iyzico_request, options)
-        result = payment.read()
-
-        if isinstance(result, str):
-            import json
-            result = json.loads(result)
+        result = await iyzico_post("/payment/detail", iyzico_request)
 
         if result.get("status") == "success":
             return {
@@ -429,40 +811,26 @@ async def get_payment_status(payment_id: str):
                 "status": "success" if result.get("paymentStatus") == "1" else "pending",
             }
 
-        raise HTTPException(
-            status_code=400,
-            detail={
-                "success": False,
-                "errorCode": result.get("errorCode", "status_check_failed"),
-                "errorMessage": result.get("errorMessage", "Status check failed"),
-            },
-        )
+        raise _bad_request(result, "status_check_failed", "Status check failed")
 
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail={"success": False, "errorCode": "server_error", "errorMessage": str(e)},
-        )
+        raise _server_error(e)
 
 
 @app.get("/payment/cards")
-async def list_saved_cards(cardUserKey: str = Query(...)):
+@limiter.limit(READ_RATE_LIMIT)
+async def list_saved_cards(request: Request, cardUserKey: str = Query(...)):
     """List saved cards."""
     try:
         iyzico_request = {
             "locale": "tr",
-            "conversationId": str(int(time.time())),
+            "conversationId": uuid4().hex,
             "cardUserKey": cardUserKey,
         }
 
-        card_list = iyzipay.CardList().retrieve(iyzico_request, options)
-        result = card_list.read()
-
-        if isinstance(result, str):
-            import json
-            result = json.loads(result)
+        result = await iyzico_post("/cardstorage/cards", iyzico_request)
 
         if result.get("status") == "success":
             return {
@@ -480,84 +848,50 @@ async def list_saved_cards(cardUserKey: str = Query(...)):
                 ],
             }
 
-        raise HTTPException(
-            status_code=400,
-            detail={
-                "success": False,
-                "errorCode": result.get("errorCode", "cards_list_failed"),
-                "errorMessage": result.get("errorMessage", "Failed to list cards"),
-            },
-        )
+        raise _bad_request(result, "cards_list_failed", "Failed to list cards")
 
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail={"success": False, "errorCode": "server_error", "errorMessage": str(e)},
-        )
+        raise _server_error(e)
 
 
 @app.post("/payment/cards/charge")
-async def charge_saved_card(request: ChargeRequest):
+@limiter.limit(PAYMENT_RATE_LIMIT)
+async def charge_saved_card(request: Request, body: ChargeRequest):
     """Charge saved card."""
     try:
+        buyer, shipping_address, billing_address = _buyer_blocks(body.buyer)
         iyzico_request = {
             "locale": "tr",
-            "conversationId": request.orderId,
-            "price": str(request.amount),
-            "paidPrice": str(request.amount),
+            "conversationId": body.orderId,
+            "price": _fmt_money(body.amount),
+            "paidPrice": _fmt_money(body.amount),
             "currency": "TRY",
             "installment": "1",
-            "basketId": request.orderId,
+            "basketId": body.orderId,
             "paymentChannel": "WEB",
             "paymentGroup": "PRODUCT",
             "paymentCard": {
-                "cardToken": request.cardToken,
-                "cardUserKey": request.cardUserKey,
-            },
-            "buyer": {
-                "id": request.buyer.id,
-                "name": request.buyer.name,
-                "surname": request.buyer.surname,
-                "gsmNumber": request.buyer.phone,
-                "email": request.buyer.email,
-                "identityNumber": request.buyer.identityNumber or "11111111111",
-                "registrationAddress": request.buyer.address,
-                "ip": request.buyer.ip,
-                "city": request.buyer.city,
-                "country": request.buyer.country,
-            },
-            "shippingAddress": {
-                "contactName": f"{request.buyer.name} {request.buyer.surname}",
-                "city": request.buyer.city,
-                "country": request.buyer.country,
-                "address": request.buyer.address,
-            },
-            "billingAddress": {
-                "contactName": f"{request.buyer.name} {request.buyer.surname}",
-                "city": request.buyer.city,
-                "country": request.buyer.country,
-                "address": request.buyer.address,
+                "cardToken": body.cardToken,
+                "cardUserKey": body.cardUserKey,
             },
+            "buyer": buyer,
+            "shippingAddress": shipping_address,
+            "billingAddress": billing_address,
             "basketItems": [
                 {
                     "id": item.id,
                     "name": item.name,
                     "category1": item.category,
-                    "itemType": "PHYSICAL" if item.itemType == "physical" else "VIRTUAL",
-                    "price": str(item.price),
+                    "itemType": _ITEM_TYPE_MAP.get(item.itemType, _DEFAULT_ITEM_TYPE),
+                    "price": _fmt_money(item.price),
                 }
-                for item in request.basketItems
+                for item in body.basketItems
             ],
         }
 
-        payment = iyzipay.Payment().create(iyzico_request, options)
-        result = payment.read()
-
-        if isinstance(result, str):
-            import json
-            result = json.loads(result)
+        result = await iyzico_post("/payment/auth", iyzico_request)
 
         response = map_payment_response(result)
         if not response["success"]:
@@ -567,49 +901,32 @@ async def charge_saved_card(request: ChargeRequest):
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail={"success": False, "errorCode": "server_error", "errorMessage": str(e)},
-        )
+        raise _server_error(e)
 
 
 @app.delete("/payment/cards/{card_token}")
-async def delete_saved_card(card_token: str, cardUserKey: str = Query(...)):
+@limiter.limit(PAYMENT_RATE_LIMIT)
+async def delete_saved_card(request: Request, card_token: str, cardUserKey: str = Query(...)):
     """Delete saved card."""
     try:
         iyzico_request = {
             "locale": "tr",
-            "conversationId": str(int(time.time())),
+            "conversationId": uuid4().hex,
             "cardToken": card_token,
             "cardUserKey": cardUserKey,
         }
 
-        card = iyzipay.Card().delete(iyzico_request, options)
-        result = card.read()
-
-        if isinstance(result, str):
-            import json
-            result = json.loads(result)
+        result = await iyzico_call("DELETE", "/cardstorage/card", iyzico_request)
 
         if result.get("status") == "success":
             return {"success": True}
 
-        raise HTTPException(
-            status_code=400,
-            detail={
-                "success": False,
-                "errorCode": result.get("errorCode", "card_delete_failed"),
-                "errorMessage": result.get("errorMessage", "Failed to delete card"),
-            },
-        )
+        raise _bad_request(result, "card_delete_failed", "Failed to delete card")
 
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail={"success": False, "errorCode": "server_error", "errorMessage": str(e)},
-        )
+        raise _server_error(e)
 
 
 @app.get("/health")
@@ -620,4 +937,23 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 3000)))
+
+    # In-memory rate limits are per process, so only scale out with shared storage
+    shared_limits = not RATE_LIMIT_STORAGE_URI.startswith("memory://")
+    workers = int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) if shared_limits else 1))
+    if workers > 1 and not shared_limits:
+        print(
+            f"WARNING: {workers} workers with in-memory rate limiting; each worker keeps "
+            "its own counters. Set RATE_LIMIT_STORAGE_URI to a shared Redis.",
+            file=sys.stderr,
+        )
+
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", 3000)),
+        workers=workers,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",  # uvloop has no Windows support
+        http="httptools",
+        access_log=False,
+    )